@@ -19,9 +19,24 @@ __all__ = [
 
 from .context import ProjectContext  # noqa: E402
 from .rag_manager import RAGManager  # noqa: E402
-from .api_manager import GeminiAPIManager  # noqa: E402
-from .workflow import ProjectWorkflowManager  # noqa: E402
-from .cli import WorkflowCLI  # noqa: E402
+
+# These pull in the Gemini SDK, so only import them on first access (PEP 562)
+_LAZY_IMPORTS = {
+    "GeminiAPIManager": ".api_manager",
+    "ProjectWorkflowManager": ".workflow",
+    "WorkflowCLI": ".cli",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        from importlib import import_module
+
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __version__ = "0.1.0"
 __author__ = "Huy Tran"
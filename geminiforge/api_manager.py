@@ -3,25 +3,67 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import random
 import re
-from dataclasses import asdict
-from typing import Dict, List, Optional
+import time
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-import google.generativeai as genai
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from . import json_utils
+from .llm_cache import LLMCache
+
+if TYPE_CHECKING:
+    from .context import ProjectContext
+
+try:
+    import h2  # noqa: F401  (lets httpx speak HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2 is optional, httpx falls back to HTTP/1.1
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__) 
 
-class GeminiAPIManager:
-    """Manage five Gemini APIs with specialized roles"""
-    
-    def __init__(self, api_keys: List[str]):
-        self.api_keys = api_keys
-        self.models = {}
-        self.setup_models()
-        
-        # Define the system prompts for each API
-        self.system_prompts = {
-            "planner": """You are a senior business analyst and product manager. 
+# Patterns used by fix_common_json_issues
+_JSON_SPECIAL = re.compile(r'["\\,\x00-\x1f]')
+_JSON_WS = re.compile(r'[ \t\r\n]*')
+_STRING_CTRL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Retry tuning: a rate-limited key sits out KEY_COOLDOWN seconds, other
+# errors back off with full jitter capped at BACKOFF_CAP seconds
+KEY_COOLDOWN = 60.0
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 30.0
+
+# Input token budget per prompt; RAG context is trimmed to stay under it.
+# Token counts are estimated from characters at a fixed ratio, so the same
+# inputs are always trimmed the same way and keep their cache key.
+PROMPT_TOKEN_BUDGET = 64_000
+CHARS_PER_TOKEN = 4.0
+RAG_TRUNCATION_MARKER = "\n[... RAG context truncated to fit the prompt token budget]"
+
+# Generation settings for every call; longer responses allowed for source code
+GENERATION_CONFIG = MappingProxyType({
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+})
+
+# Roles with large code/config payloads, streamed instead of buffered
+STREAMED_ROLES = frozenset({"developer", "reviewer", "devops"})
+
+# C-accelerated decoder for pulling the first JSON object out of prose
+_JSON_DECODER = json.JSONDecoder()
+
+# Role-specific system prompts, shared by every manager instance
+SYSTEM_PROMPTS = MappingProxyType({
+    "planner": """You are a senior business analyst and product manager. 
             Analyze requirements and create detailed specifications.
             
             RETURN ONLY VALID JSON with this structure:
@@ -34,8 +76,8 @@ class GeminiAPIManager:
             }
             
             Keep strings short and avoid multiline content.""",
-            
-            "architect": """You are a system architect with 15+ years experience.
+
+    "architect": """You are a system architect with 15+ years experience.
             Design scalable architectures and database schemas.
             
             RETURN ONLY VALID JSON with this structure:
@@ -52,8 +94,8 @@ class GeminiAPIManager:
             }
             
             Keep all values as simple strings or arrays.""",
-            
-            "developer": """You are a senior full-stack developer.
+
+    "developer": """You are a senior full-stack developer.
             Generate COMPLETE, PRODUCTION-READY source code files.
             
             RETURN ONLY VALID JSON with this structure:
@@ -75,8 +117,21 @@ class GeminiAPIManager:
             Generate real, functional code that can be executed immediately.
             Use proper imports, error handling, and best practices.
             Each file should be production-ready and fully functional.""",
+
+    # Per-file generation after the module plan (generate_files); runs on the developer's key
+    "developer_file": """You are a senior full-stack developer.
+            Write the COMPLETE contents of ONE source file of the project.
+            
+            RETURN ONLY VALID JSON with this structure:
+            {
+                "path": "path/of/the/file",
+                "content": "COMPLETE_FILE_CONTENT_HERE"
+            }
             
-            "reviewer": """You are a code review expert and QA engineer.
+            CRITICAL: content must be the whole, RUNNABLE file, not a description or excerpt.
+            Use proper imports, error handling, and best practices.""",
+
+    "reviewer": """You are a code review expert and QA engineer.
             Review code quality and generate COMPLETE test files with actual test code.
             
             RETURN ONLY VALID JSON with this structure:
@@ -93,8 +148,8 @@ class GeminiAPIManager:
             
             CRITICAL: test_files must contain COMPLETE, RUNNABLE test code, not descriptions.
             Generate real test functions with assertions, mocks, and proper test structure.""",
-            
-            "devops": """You are a DevOps engineer specializing in CI/CD and cloud deployment.
+
+    "devops": """You are a DevOps engineer specializing in CI/CD and cloud deployment.
             Create COMPLETE deployment configuration files with actual content.
             
             RETURN ONLY VALID JSON with this structure:
@@ -114,33 +169,10 @@ class GeminiAPIManager:
             
             CRITICAL: All files must contain COMPLETE, FUNCTIONAL configuration content.
             Generate real Dockerfiles, YAML configs, and scripts that can be used immediately."""
-        }
-    
-    def setup_models(self):
-        """Initialize 5 Gemini models with different API keys"""
-        for i, api_key in enumerate(self.api_keys):
-            genai.configure(api_key=api_key)
-            model_name = ['planner', 'architect', 'developer', 'reviewer', 'devops'][i]
-            self.models[model_name] = genai.GenerativeModel('gemini-2.0-flash')
-            logger.info(f"Initialized {model_name} model with API key {i+1}")
-    
-    async def call_api(self, model_name: str, prompt: str, context: ProjectContext, rag_context: str = "") -> Dict:
-        """Call the API with error handling and retry logic"""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                # Create the full prompt using the system prompt, project context, RAG context, and user request
-                full_prompt = f"""
-{self.system_prompts[model_name]}
-
-PROJECT CONTEXT:
-{json.dumps(asdict(context), indent=2, ensure_ascii=False)}
+})
 
-RAG CONTEXT (EXISTING PROJECT FILES):
-{rag_context}
-
-USER REQUEST:
-{prompt}
+# Static trailer appended to every prompt
+PROMPT_RULES = """
 
 CRITICAL JSON FORMATTING RULES:
 1. For code_files: use "file_path": "COMPLETE_SOURCE_CODE" format
@@ -152,38 +184,259 @@ CRITICAL JSON FORMATTING RULES:
 
 IMPORTANT: Review the RAG context to understand existing project structure and generate complete, working code.
 """
+
+# Static trailer for the single-file prompts
+FILE_PROMPT_RULES = """
+
+CRITICAL JSON FORMATTING RULES:
+1. Return exactly one object: {"path": ..., "content": ...}
+2. content holds the FULL file, with proper JSON escaping (\\n for newlines)
+3. DO NOT use descriptions - generate actual executable code
+4. Response must be valid JSON - test it before sending
+
+IMPORTANT: Review the RAG context so the file fits the existing project structure.
+"""
+
+# Trailer by system prompt name; anything not listed gets PROMPT_RULES
+PROMPT_TRAILERS = MappingProxyType({
+    "developer_file": FILE_PROMPT_RULES,
+})
+
+# Per-prompt head, everything before the project context
+PROMPT_PREFIXES = MappingProxyType({
+    name: f"\n{system_prompt}\n\nPROJECT CONTEXT:\n" for name, system_prompt in SYSTEM_PROMPTS.items()
+})
+
+class GeminiAPIManager:
+    """Manage five Gemini APIs with specialized roles"""
+    
+    ROLES: Tuple[str, ...] = ("planner", "architect", "developer", "reviewer", "devops")
+    
+    def __init__(self, api_keys: List[str], cache: Optional[LLMCache] = None):
+        self.api_keys = api_keys
+        self.models = {}
+        self.cache = cache if cache is not None else LLMCache()
+        self.setup_models()
+    
+    def setup_models(self):
+        """Initialize 5 Gemini clients with different API keys"""
+        # One keep-alive connection pool shared by every client, so warm
+        # connections are reused across agents and retries. With HTTP/2 the
+        # concurrent calls of a stage multiplex over a single connection.
+        self.http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+        )
+        http_options = types.HttpOptions(httpx_async_client=self.http_client, timeout=120_000)
+        
+        # Every role owns one key but may borrow the others while it is rate limited.
+        # Roles configured with the same key share its client and cooldown, so
+        # rotation never "switches" to a key that is already exhausted.
+        self.clients = []
+        self.key_cooldowns = []
+        self.role_keys = {}
+        key_indexes = {}
+        for i, (model_name, api_key) in enumerate(zip(self.ROLES, self.api_keys)):
+            if api_key not in key_indexes:
+                key_indexes[api_key] = len(self.clients)
+                self.clients.append(genai.Client(api_key=api_key, http_options=http_options))
+                self.key_cooldowns.append(0.0)
+            self.role_keys[model_name] = key_indexes[api_key]
+            self.models[model_name] = self.clients[key_indexes[api_key]]
+            logger.info("Initialized %s model with API key %d", model_name, i + 1)
+    
+    def next_available_key(self, model_name: str) -> int:
+        """Index of the role's own key, or the next key not cooling down; -1 if all are"""
+        now = time.monotonic()
+        own = self.role_keys[model_name]
+        for offset in range(len(self.clients)):
+            key_index = (own + offset) % len(self.clients)
+            if self.key_cooldowns[key_index] <= now:
+                return key_index
+        return -1
+    
+    @staticmethod
+    def is_rate_limited(error: Exception) -> bool:
+        """Whether the error is a 429 / RESOURCE_EXHAUSTED response"""
+        return isinstance(error, errors.APIError) and error.code == 429
+    
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    
+    async def aclose(self):
+        """Close the shared HTTP connection pool"""
+        await self.http_client.aclose()
+        logger.info("🔌 Closed Gemini connection pool")
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    async def call_api(self, model_name: str, prompt: str, context: ProjectContext, rag_context: str = "",
+                       prompt_name: Optional[str] = None) -> Dict:
+        """Call the API with error handling and retry logic
+        
+        `model_name` is the role whose key, streaming mode and fallback are used;
+        `prompt_name` picks a different system prompt (default: the role's own).
+        """
+        prompt_name = prompt_name or model_name
+        if model_name not in self.role_keys or prompt_name not in PROMPT_PREFIXES:
+            logger.error("❌ Unknown model %s (prompt %s)", model_name, prompt_name)
+            return self.get_default_structure(model_name)
+        
+        max_retries = 3
+        # Context doesn't change between retries, serialize it once
+        ctx_json = context.to_prompt_json()
+        rag_context = self.fit_rag_context(prompt_name, prompt, ctx_json, rag_context)
+        # Only the context, RAG context and request vary between calls
+        full_prompt = "".join((
+            PROMPT_PREFIXES[prompt_name], ctx_json,
+            "\n\nRAG CONTEXT (EXISTING PROJECT FILES):\n", rag_context,
+            "\n\nUSER REQUEST:\n", LLMCache.normalize_prompt(prompt),
+            PROMPT_TRAILERS.get(prompt_name, PROMPT_RULES),
+        ))
+        generation_config = dict(GENERATION_CONFIG)
+        
+        # Identical calls (same role, model, settings and prompt) are answered from the cache
+        cache_key = LLMCache.make_key(model_name, GEMINI_MODEL, json_utils.dumps(generation_config), full_prompt)
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("♻️ %s response served from cache", model_name)
+            return cached
+        
+        attempt = 0  # failed attempts; moving to a fresh key after a 429 doesn't count as one
+        # Room for every key to be tried once on top of the retries
+        for _ in range(max_retries + len(self.clients)):
+            key_index = self.next_available_key(model_name)
+            if key_index == -1:
+                key_index = self.role_keys[model_name]
+            try:
+                client = self.clients[key_index]
                 
-                model = self.models[model_name]
-                
-                # Configure generation settings to allow longer responses for source code
-                generation_config = {
-                    "temperature": 0.1,
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 8192 if model_name != "developer" else 8192,  # Max tokens for code generation
-                }
-                
-                response = model.generate_content(full_prompt, generation_config=generation_config)
+                result = None
+                if model_name in STREAMED_ROLES:
+                    response_text, result = await self.stream_response(client, full_prompt, generation_config)
+                else:
+                    response = await client.aio.models.generate_content(
+                        model=GEMINI_MODEL, contents=full_prompt, config=generation_config
+                    )
+                    response_text = response.text.strip()
                 
                 # Parse the JSON response using multiple strategies
-                response_text = response.text.strip()
-                result = self.parse_json_response(response_text, model_name, attempt)
+                if result is None:
+                    result = self.parse_json_response(response_text, model_name, attempt)
                 
                 if result:
-                    logger.info(f"✅ {model_name} API call successful")
+                    logger.info("✅ %s API call successful", model_name)
+                    await self.cache.set(cache_key, result)
                     return result
                     
             except Exception as e:
-                logger.error(f"❌ API call error in {model_name}: {e}")
+                logger.error("❌ API call error in %s (key %d): %s", model_name, key_index + 1, e)
+                if self.is_rate_limited(e):
+                    # Rotate straight to another key; only back off once all keys are cooling down
+                    self.key_cooldowns[key_index] = time.monotonic() + KEY_COOLDOWN
+                    if self.next_available_key(model_name) != -1:
+                        continue
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    # Return the default structure instead of raising an exception
-                    return self.get_default_structure(model_name)
-        logger.error(f"⚠️ Falling back to default structure for {model_name} after all retries")
+                    await asyncio.sleep(self.backoff_delay(attempt))
+            
+            attempt += 1
+            if attempt >= max_retries:
+                break
+        logger.error("⚠️ Falling back to default structure for %s after all retries", model_name)
         return self.get_default_structure(model_name)
 
     
+    def fit_rag_context(self, prompt_name: str, prompt: str, ctx_json: str, rag_context: str) -> str:
+        """Trim the RAG context so the whole prompt stays within PROMPT_TOKEN_BUDGET
+        
+        Keeps the head of the context and cuts on a line boundary, so the kept
+        part is a stable prefix across calls.
+        """
+        trailer = PROMPT_TRAILERS.get(prompt_name, PROMPT_RULES)
+        fixed_chars = len(PROMPT_PREFIXES[prompt_name]) + len(ctx_json) + len(prompt) + len(trailer) + 64
+        budget_chars = int(PROMPT_TOKEN_BUDGET * CHARS_PER_TOKEN) - fixed_chars
+        if len(rag_context) <= budget_chars:
+            return rag_context
+        
+        cut = rag_context.rfind("\n", 0, max(budget_chars, 0))
+        logger.warning("✂️ Trimmed RAG context for %s from %d to %d chars", prompt_name, len(rag_context), max(cut, 0))
+        return rag_context[:max(cut, 0)] + RAG_TRUNCATION_MARKER
+    
+    async def generate_files(self, model_name: str, file_prompts: Dict[str, str], context: ProjectContext,
+                             rag_context: str = "", concurrency: int = 8,
+                             semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, str]:
+        """Generate one file per call, at most `concurrency` calls in flight
+        
+        Calls use the role's key with the "<role>_file" system prompt, which asks
+        for {"path": ..., "content": ...}. Returns the generated contents by path;
+        files whose call failed are left out so the caller can keep its existing
+        content. Pass a shared `semaphore` to bound several concurrent
+        generate_files runs together.
+        """
+        prompt_name = f"{model_name}_file"
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(concurrency)
+        
+        async def generate_one(file_path: str, prompt: str):
+            async with semaphore:
+                result = await self.call_api(model_name, prompt, context, rag_context, prompt_name=prompt_name)
+            content = None
+            # A failed call returns the default structure, whose code_files are placeholders
+            if result.get("status") != "partial_failure":
+                content = result.get("content")
+                if content is None and isinstance(result.get("code_files"), dict):
+                    # The model answered in the module-plan shape
+                    content = result["code_files"].get(file_path)
+            if not isinstance(content, str) or not content:
+                logger.warning("⚠️ No content generated for %s", file_path)
+                return file_path, None
+            return file_path, content
+        
+        results = await asyncio.gather(*(generate_one(path, prompt) for path, prompt in file_prompts.items()))
+        return {path: content for path, content in results if content is not None}
+    
+    async def stream_response(self, client: genai.Client, full_prompt: str, generation_config: Dict):
+        """Stream a response, stopping as soon as its top-level JSON object is complete
+        
+        Returns the text received so far and the decoded object, or None when
+        the stream ended without a complete, non-empty object.
+        """
+        chunks = []
+        stream = await client.aio.models.generate_content_stream(
+            model=GEMINI_MODEL, contents=full_prompt, config=generation_config
+        )
+        try:
+            async for chunk in stream:
+                text = chunk.text
+                if not text:
+                    continue
+                chunks.append(text)
+                
+                # Only a chunk that closes a brace can complete the object
+                if '}' not in text:
+                    continue
+                buffered = "".join(chunks)
+                start = buffered.find('{')
+                if start == -1:
+                    continue
+                try:
+                    result, _ = _JSON_DECODER.raw_decode(buffered, start)
+                except ValueError:
+                    continue
+                # An empty or non-object value is left to parse_json_response on the full text
+                if isinstance(result, dict) and result:
+                    return buffered.strip(), result
+        finally:
+            await stream.aclose()
+        
+        return "".join(chunks).strip(), None
+    
     def parse_json_response(self, response_text: str, model_name: str, attempt: int) -> Optional[Dict]:
         """Parse the JSON response using multiple strategies"""
         parsing_strategies = [
@@ -193,31 +446,51 @@ IMPORTANT: Review the RAG context to understand existing project structure and g
             self.parse_line_by_line_json
         ]
         
-        for i, strategy in enumerate(parsing_strategies):
+        # Try the strategy matching the response shape first, the rest only on failure
+        first = self.classify_response(response_text)
+        if first is None:
+            logger.error("❌ No JSON object in response for %s (attempt %d)", model_name, attempt + 1)
+            return None
+        order = [first] + [i for i in range(len(parsing_strategies)) if i != first]
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
+        for i in order:
             try:
-                result = strategy(response_text)
+                result = parsing_strategies[i](response_text)
                 if result:
-                    logger.info(f"✅ JSON parsed using strategy {i+1} for {model_name}")
+                    logger.info("✅ JSON parsed using strategy %d for %s", i + 1, model_name)
                     return result
             except Exception as e:
-                logger.debug(f"Strategy {i+1} failed for {model_name}: {e}")
+                if debug_enabled:
+                    logger.debug("Strategy %d failed for %s: %s", i + 1, model_name, e)
                 continue
         
-        logger.error(f"❌ All JSON parsing strategies failed for {model_name} (attempt {attempt+1})")
+        logger.error("❌ All JSON parsing strategies failed for %s (attempt %d)", model_name, attempt + 1)
         return None
     
+    def classify_response(self, text: str) -> Optional[int]:
+        """Index of the parsing strategy that fits the response shape, None if there is no JSON object"""
+        brace = text.find('{')
+        if brace == -1:
+            return None
+        if not text[:brace].strip():
+            return 0  # clean JSON
+        if '```' in text[:brace]:
+            return 1  # markdown fenced
+        return 2  # JSON embedded in prose
+    
     def parse_clean_json(self, text: str) -> Dict:
         """Parse JSON directly from clean text"""
-        return json.loads(text.strip())
+        return json_utils.loads(text.strip())
     
     def parse_markdown_json(self, text: str) -> Dict:
         """Parse JSON from markdown blocks"""
         if '```json' in text:
             json_content = text.split('```json')[1].split('```')[0].strip()
-            return json.loads(json_content)
+            return json_utils.loads(json_content)
         elif '```' in text:
             json_content = text.split('```')[1].split('```')[0].strip()
-            return json.loads(json_content)
+            return json_utils.loads(json_content)
         raise ValueError("No markdown JSON found")
     
     def parse_partial_json(self, text: str) -> Dict:
@@ -226,36 +499,24 @@ IMPORTANT: Review the RAG context to understand existing project structure and g
         if start == -1:
             raise ValueError("No JSON object found")
         
-        brace_count = 0
-        end = start
-        
-        for i in range(start, len(text)):
-            if text[i] == '{':
-                brace_count += 1
-            elif text[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    end = i + 1
-                    break
-        
-        if brace_count != 0:
-            raise ValueError("Incomplete JSON object")
-        
-        json_str = text[start:end]
-        return json.loads(json_str)
+        # raw_decode stops at the end of the first complete object
+        result, _ = _JSON_DECODER.raw_decode(text, start)
+        return result
     
     def parse_line_by_line_json(self, text: str) -> Dict:
         """Parse JSON line by line to find errors"""
-        lines = text.split('\n')
         json_lines = []
-        in_json = False
+        depth = 0
         
-        for line in lines:
-            if line.strip().startswith('{') or in_json:
-                in_json = True
-                json_lines.append(line)
-                if line.strip().endswith('}') and line.count('}') >= line.count('{'):
-                    break
+        # Track the net brace depth across lines and stop once the first
+        # object closes, rather than re-checking each line in isolation
+        for line in text.split('\n'):
+            if not json_lines and not line.lstrip().startswith('{'):
+                continue
+            json_lines.append(line)
+            depth += line.count('{') - line.count('}')
+            if depth <= 0:
+                break
         
         if not json_lines:
             raise ValueError("No JSON content found")
@@ -265,20 +526,56 @@ IMPORTANT: Review the RAG context to understand existing project structure and g
         # Fix common JSON issues
         json_str = self.fix_common_json_issues(json_str)
         
-        return json.loads(json_str)
+        return json_utils.loads(json_str)
     
     def fix_common_json_issues(self, json_str: str) -> str:
-        """Fix common JSON formatting issues"""
-        # Remove trailing commas
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-        
-        # Fix unescaped quotes in strings (basic fix)  
-        json_str = re.sub(r'(?<!\\)"(?![,\]\}:\s])', r'\\"', json_str)
+        """Fix common JSON formatting issues
         
-        # Remove control characters
-        json_str = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', json_str)
+        Single pass that tracks whether it is inside a string, so valid JSON
+        comes out unchanged:
+        - trailing commas before } or ] are removed
+        - a quote inside a string that isn't followed by , : } ] is escaped
+        - raw newlines/tabs inside strings are escaped, other control characters dropped
+        """
+        out = []
+        pos = 0
+        in_string = False
+        for match in _JSON_SPECIAL.finditer(json_str):
+            i = match.start()
+            if i < pos:
+                continue  # consumed as part of an escape sequence
+            out.append(json_str[pos:i])
+            pos = i + 1
+            ch = json_str[i]
+            
+            if ch == '\\':
+                if in_string:
+                    out.append(json_str[i:i + 2])
+                    pos = i + 2
+                else:
+                    out.append(ch)
+            elif ch == '"':
+                if not in_string:
+                    in_string = True
+                    out.append(ch)
+                else:
+                    after = _JSON_WS.match(json_str, pos).end()
+                    if after == len(json_str) or json_str[after] in ',:}]':
+                        in_string = False
+                        out.append(ch)
+                    else:
+                        out.append('\\"')
+            elif ch == ',':
+                after = _JSON_WS.match(json_str, pos).end()
+                if in_string or after == len(json_str) or json_str[after] not in '}]':
+                    out.append(ch)
+            elif in_string:
+                out.append(_STRING_CTRL_ESCAPES.get(ch, ''))
+            elif ch in ' \t\r\n':
+                out.append(ch)
         
-        return json_str
+        out.append(json_str[pos:])
+        return "".join(out)
     
     def get_default_structure(self, model_name: str) -> Dict:
         """Return the default structure when JSON parsing fails"""
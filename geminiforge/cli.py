@@ -3,10 +3,12 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 from .api_manager import GeminiAPIManager
+from .llm_cache import LLMCache
 from .workflow import ProjectWorkflowManager
 
 logger = logging.getLogger(__name__)
@@ -17,15 +19,15 @@ class WorkflowCLI:
     def __init__(self, project_name: str):
         load_dotenv()
         
-        self.API_KEYS = [
-            os.getenv("GEMINI_API_KEY_1"),
-            os.getenv("GEMINI_API_KEY_2"),
-            os.getenv("GEMINI_API_KEY_3"),
-            os.getenv("GEMINI_API_KEY_4"),
-            os.getenv("GEMINI_API_KEY_5"),
-        ]
+        key_names = [f"GEMINI_API_KEY_{i}" for i in range(1, 6)]
+        missing = [name for name in key_names if not os.environ.get(name)]
+        if missing:
+            raise ValueError(f"Missing Gemini API keys: {', '.join(missing)} (set them in the environment or .env)")
+        self.API_KEYS = [os.environ[name] for name in key_names]
         
-        self.api_manager = GeminiAPIManager(self.API_KEYS)
+        # Kept next to (not inside) the project dirs so the RAG scan doesn't index it
+        cache = LLMCache(Path("projects/.llm_cache"))
+        self.api_manager = GeminiAPIManager(self.API_KEYS, cache=cache)
         self.workflow = ProjectWorkflowManager(self.api_manager, project_name)
     
     async def status(self):
@@ -53,6 +55,16 @@ class WorkflowCLI:
         """Run full workflow"""
         return await self.workflow.run_full_workflow(user_input)
     
+    async def aclose(self):
+        """Release the API transport on shutdown"""
+        await self.api_manager.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
     async def scan_files(self):
         """Scan and show project files"""
         index = self.workflow.rag_manager.scan_project_files()
@@ -130,6 +142,9 @@ async def main():
         print(f"❌ Error: {e}")
         print("💾 Progress has been saved. You can resume later.")
         await cli.status()
+    
+    finally:
+        await cli.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Dict, Optional
-@dataclass
+
+from . import json_utils
+
+
+@dataclass(slots=True)
 class ProjectContext:
     """Shared context giữa các API"""
     project_name: str
@@ -14,7 +18,42 @@ class ProjectContext:
     deployment: Optional[Dict] = None
     created_at: str = None
     current_stage: str = "not_started"
+    _json_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _json_version: int = field(default=0, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if not self.created_at:
-            self.created_at = datetime.now().isoformat()
\ No newline at end of file
+            self.created_at = datetime.now().isoformat()
+    
+    def __setattr__(self, name, value):
+        # object.__setattr__ rather than super(): slots=True rebuilds the class,
+        # which breaks zero-argument super() on Python < 3.14
+        object.__setattr__(self, name, value)
+        # Any field assignment invalidates the cached prompt JSON
+        if not name.startswith("_"):
+            object.__setattr__(self, "_json_cache", None)
+            object.__setattr__(self, "_json_version", getattr(self, "_json_version", 0) + 1)
+    
+    @property
+    def version(self) -> int:
+        """Bumped on every field assignment, for caching values derived from the context"""
+        return self._json_version
+    
+    def to_dict(self) -> Dict:
+        """Shallow dict of the fields; unlike asdict() the nested dicts are not copied"""
+        return {
+            "project_name": self.project_name,
+            "requirements": self.requirements,
+            "architecture": self.architecture,
+            "codebase": self.codebase,
+            "test_results": self.test_results,
+            "deployment": self.deployment,
+            "created_at": self.created_at,
+            "current_stage": self.current_stage,
+        }
+    
+    def to_prompt_json(self) -> str:
+        """Context as indented JSON, re-serialized only after a field is reassigned"""
+        if self._json_cache is None:
+            object.__setattr__(self, "_json_cache", json_utils.dumps(self.to_dict()))
+        return self._json_cache
@@ -0,0 +1,18 @@
+"""
+Content hashing shared by the GeminiForge caches.
+blake2b rather than sha256: the keys only deduplicate content,
+so speed matters more than collision resistance against attackers.
+"""
+from __future__ import annotations
+
+import hashlib
+
+
+def content_key(*parts: bytes, digest_size: int = 16) -> str:
+    """Hex blake2b digest of the parts, NUL-separated so ("ab", "c") and ("a", "bc") differ"""
+    digest = hashlib.blake2b(digest_size=digest_size)
+    for i, part in enumerate(parts):
+        if i:
+            digest.update(b"\0")
+        digest.update(part)
+    return digest.hexdigest()
@@ -0,0 +1,61 @@
+"""
+JSON helpers shared by the GeminiForge modules.
+Uses orjson when it is installed and falls back to the stdlib json module.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+# Suffix of write_atomic's temporary files; scanners skip these
+TMP_SUFFIX = ".gf-tmp"
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to indented JSON text, keeping non-ASCII characters"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def dumpb(obj: Any) -> bytes:
+    """Serialize to indented UTF-8 JSON bytes, ready to write in one call"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def write_atomic(path, data: bytes) -> None:
+    """Write data to a sibling temp file and rename it over path, so readers never see a partial file"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + TMP_SUFFIX)
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def dump(obj: Any, path) -> None:
+    """Write obj to path as indented UTF-8 JSON"""
+    write_atomic(path, dumpb(obj))
+
+
+def dump_lines(rows: Iterable[Any], path) -> None:
+    """Write each row to path as one compact JSON line (JSON Lines), atomically"""
+    if orjson is not None:
+        data = b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+    else:
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+    write_atomic(path, data)
+
+
+def loads(data: str | bytes) -> Any:
+    """Parse JSON text or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,128 @@
+"""
+Response cache for the Gemini agents.
+Identical calls (same role, project context, RAG context and request)
+are answered from memory or disk instead of hitting the API again.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from . import json_utils
+from .hash_utils import content_key
+
+logger = logging.getLogger(__name__)
+
+
+# Disk entries unused for DISK_TTL seconds expire; beyond DISK_MAX_ENTRIES
+# the least recently used ones are dropped when the cache is opened
+DISK_TTL = 7 * 24 * 3600.0
+DISK_MAX_ENTRIES = 2000
+
+
+class LLMCache:
+    """Exact-match cache of parsed agent responses, in memory with optional disk backing"""
+    
+    def __init__(self, cache_dir: Optional[Path] = None, max_entries: int = 256,
+                 max_disk_entries: int = DISK_MAX_ENTRIES, disk_ttl: float = DISK_TTL):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.disk_ttl = disk_ttl
+        # Entries are kept serialized, so every hit hands out a fresh dict
+        # that callers can mutate without corrupting the cache
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        if cache_dir is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            self.prune()
+    
+    @staticmethod
+    def make_key(model_name: str, *parts: str) -> str:
+        """Hash the role and prompt parts into a cache key"""
+        return content_key(model_name.encode("utf-8"), *(part.encode("utf-8") for part in parts))
+    
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Strip surrounding whitespace only: prompts embed paths and code, where case and indentation matter"""
+        return prompt.strip()
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached response, memory first then disk (read in a worker thread)"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return json_utils.loads(self._memory[key])
+        
+        if self.cache_dir is None:
+            return None
+        entry = await asyncio.to_thread(self._read_entry, key)
+        if entry is None:
+            return None
+        value, data = entry
+        self._remember(key, data)
+        return value
+    
+    async def set(self, key: str, value: Dict):
+        """Store a response in memory and, if configured, on disk (written in a worker thread)"""
+        data = json_utils.dumpb(value)
+        self._remember(key, data)
+        if self.cache_dir is None:
+            return
+        
+        await asyncio.to_thread(json_utils.write_atomic, self.cache_dir / f"{key}.json", data)
+    
+    def _read_entry(self, key: str) -> Optional[Tuple[Dict, bytes]]:
+        """Load one entry from the cache directory as (value, raw bytes); None if missing or corrupt"""
+        cache_file = self.cache_dir / f"{key}.json"
+        try:
+            if time.time() - cache_file.stat().st_mtime > self.disk_ttl:
+                return None
+            data = cache_file.read_bytes()
+            value = json_utils.loads(data)
+            os.utime(cache_file)  # mtime doubles as last use, for prune()
+            return value, data
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"⚠️ Ignoring corrupt cache entry {cache_file}: {e}")
+            return None
+    
+    def prune(self):
+        """Delete expired disk entries (and stray temp files), then the least recently used beyond max_disk_entries"""
+        now = time.time()
+        entries = []
+        removed = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                    if now - mtime > self.disk_ttl:
+                        os.unlink(entry.path)
+                        removed += 1
+                    elif entry.name.endswith(".json"):
+                        entries.append((mtime, entry.path))
+                except FileNotFoundError:
+                    continue  # removed concurrently
+        
+        if len(entries) > self.max_disk_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_disk_entries]:
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"🧹 Pruned {removed} entries from {self.cache_dir}")
+    
+    def _remember(self, key: str, data: bytes):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
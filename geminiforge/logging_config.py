@@ -3,20 +3,6 @@ Central logging configuration for GeminiForge.
 Called once by geminiforge.__init__ so every sub-module
 inherits the same JSON-style formatter.
 """
-import asyncio
-import json
-import os
-import re
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Any, Optional
-import google.generativeai as genai
-from dataclasses import dataclass, asdict
-import logging
-from dotenv import load_dotenv
-load_dotenv()
-from geminiforge.context import ProjectContext
-import logging
 import logging.config
 
 LOGGING = {
@@ -1,13 +1,58 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import json_utils
 
 logger = logging.getLogger(__name__)
 
+# File type by (lower-case) extension
+FILE_TYPES = MappingProxyType({
+    ".py": "python",
+    ".js": "javascript",
+    ".java": "java",
+    ".sql": "sql",
+    ".json": "json",
+    ".yml": "yaml",
+    ".yaml": "yaml",
+    ".md": "markdown",
+    ".txt": "text",
+    ".properties": "properties",
+})
+
+# Files whose content is kept between scans, keyed by path + mtime + size
+CONTENT_CACHE_MAX = 10000
+READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+READ_TIMEOUT = 10.0  # seconds
+
+# Known binary formats are indexed without reading them
+BINARY_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp", ".pdf",
+    ".zip", ".gz", ".tar", ".jar", ".class", ".pyc", ".so", ".dll", ".exe",
+    ".woff", ".woff2", ".ttf", ".db", ".sqlite",
+})
+
+# Files of 10KB+ are only previewed, so just their head is read:
+# enough bytes for the 500-char preview even if every char is 4-byte UTF-8
+PREVIEW_READ_BYTES = 2000
+
+# File types (as classified by the scan) whose head is previewed in the review context
+PREVIEW_TYPES = frozenset({"python", "javascript", "java"})
+
+# A directory listing is only reused once the directory's mtime is older than
+# this, so entries added within the same timestamp tick are not missed
+DIR_MTIME_SLACK_NS = 2_000_000_000
+
 class RAGManager:
     """Manage the RAG system so Gemini can review the source code"""
     
@@ -15,24 +60,30 @@ class RAGManager:
         self.project_dir = project_dir
         self.source_index = {}
         self.file_contents = {}
+        self._content_cache: OrderedDict[str, tuple] = OrderedDict()
+        self._dir_listings: Dict[str, tuple] = {}
+        # Built stage contexts, valid while the scanned files are unchanged
+        self._context_cache: Dict[tuple, str] = {}
+        self._index_version = 0
+        # General context and the index it was built from; it embeds the scan time, so it's rebuilt after every scan
+        self._general_context: Tuple[Optional[Dict], str] = (None, "")
+        # One scan at a time when scans run in worker threads
+        self._scan_lock = asyncio.Lock()
+        # Stage name -> context builder; anything else gets the general context
+        self._context_builders = {
+            "requirements": self._build_requirements_context,
+            "architecture": self._build_architecture_context,
+            "code": self._build_code_context,
+            "review": self._build_review_context,
+            "deployment": self._build_deployment_context,
+        }
+        # Hash of the last rag_index.json written, to skip identical saves
+        self._last_index_hash: Optional[int] = None
         
     def scan_project_files(self) -> Dict[str, Any]:
         """Scan the entire project to build an index for RAG system"""
         logger.info("🔍 Scanning project files for RAG system...")
         
-        file_types = {
-            ".py": "python",
-            ".js": "javascript", 
-            ".java": "java",
-            ".sql": "sql",
-            ".json": "json",
-            ".yml": "yaml",
-            ".yaml": "yaml",
-            ".md": "markdown",
-            ".txt": "text",
-            ".properties": "properties"
-        }
-        
         project_structure = {
             "files": {},
             "directories": [],
@@ -47,200 +98,388 @@ class RAGManager:
         if not self.project_dir.exists():
             return project_structure
             
-        for file_path in self.project_dir.rglob("*"):
-            if file_path.is_file():
+        # Walk and stat first, then read the changed files concurrently
+        scanned = []
+        errors = []
+        for relative_path, path, is_dir in self._walk(str(self.project_dir), errors):
+            if is_dir:
+                project_structure["directories"].append(relative_path)
+            else:
                 try:
-                    relative_path = file_path.relative_to(self.project_dir)
-                    file_ext = file_path.suffix.lower()
-                    file_type = file_types.get(file_ext, "unknown")
-                    
-                    # Read file content (limit size to avoid overload)
-                    file_size = file_path.stat().st_size
-                    if file_size < 50000:  # < 50KB
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                        except:
-                            with open(file_path, 'r', encoding='latin-1') as f:
-                                content = f.read()
-                    else:
-                        content = f"[File too large: {file_size} bytes]"
-                    
-                    project_structure["files"][str(relative_path)] = {
-                        "type": file_type,
-                        "size": file_size,
-                        "modified": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat(),
-                        "content_preview": content[:500] if len(content) > 500 else content
-                    }
-                    
-                    # Full content for small files 
-                    if file_size < 10000:  # < 10KB
-                        self.file_contents[str(relative_path)] = content
-                    
-                    # Update statistics
-                    project_structure["summary"]["total_files"] += 1
-                    project_structure["summary"]["file_types"][file_type] = \
-                        project_structure["summary"]["file_types"].get(file_type, 0) + 1
-                        
-                except Exception as e:
-                    logger.warning(f"⚠️ Could not process file {file_path}: {e}")
+                    scanned.append((relative_path, path, os.stat(path)))
+                except OSError as e:
+                    errors.append(f"{path}: {e}")
+        
+        contents = self._read_contents(scanned, errors)
+        if errors:
+            # One line for the lot: an unreadable tree can fail on thousands of files
+            logger.warning(f"⚠️ Skipped {len(errors)} unreadable paths, e.g. {'; '.join(errors[:3])}")
+            logger.debug("Unreadable files:\n" + "\n".join(errors))
+        
+        # Files are also grouped by module, and by top-level stage directory for
+        # the context builders, in the same pass
+        modules = project_structure["modules"]
+        by_stage = project_structure["by_stage"] = {}
+        for relative_path, path, st in scanned:
+            content = contents.get(relative_path)
+            if content is None:
+                continue  # unreadable, already logged
+            
+            # Extensions never contain a separator, so a dot in a directory name
+            # just yields a key that isn't in FILE_TYPES
+            dot = relative_path.rfind('.')
+            file_type = FILE_TYPES.get(relative_path[dot:].lower(), "unknown") if dot != -1 else "unknown"
+            file_size = st.st_size
+            
+            project_structure["files"][relative_path] = {
+                "type": file_type,
+                "size": file_size,
+                "modified": datetime.fromtimestamp(st.st_mtime).isoformat(),
+                "content_preview": content[:500]
+            }
+            
+            # Full content for small files 
+            if file_size < 10000:  # < 10KB
+                self.file_contents[relative_path] = content
             
-            elif file_path.is_dir():
-                relative_path = file_path.relative_to(self.project_dir)
-                if relative_path != Path("."):
-                    project_structure["directories"].append(str(relative_path))
-        
-        # Organize by modules
-        for file_path in project_structure["files"]:
-            parts = Path(file_path).parts
+            # Update statistics
+            project_structure["summary"]["total_files"] += 1
+            project_structure["summary"]["file_types"][file_type] = \
+                project_structure["summary"]["file_types"].get(file_type, 0) + 1
+            
+            # Organize by modules
+            parts = relative_path.split(os.sep, 2)
+            by_stage.setdefault(parts[0], []).append(relative_path)
             if len(parts) > 1:
                 module_name = parts[1] if parts[0] == "03_code" else parts[0]
-                if module_name not in project_structure["modules"]:
-                    project_structure["modules"][module_name] = []
-                project_structure["modules"][module_name].append(file_path)
+                modules.setdefault(module_name, []).append(relative_path)
         
+        changed = (project_structure["files"] != self.source_index.get("files")
+                   or project_structure["directories"] != self.source_index.get("directories"))
+        # Publish the new index before invalidating, so a context built in between
+        # lands under the old version and is never served again
         self.source_index = project_structure
+        if changed:
+            self._index_version += 1
+            self._context_cache.clear()
         logger.info(f"✅ Scanned {project_structure['summary']['total_files']} files")
         return project_structure
     
+    async def scan_project_files_async(self) -> Dict[str, Any]:
+        """scan_project_files in a worker thread, so the event loop keeps serving API calls"""
+        async with self._scan_lock:
+            return await asyncio.to_thread(self.scan_project_files)
+    
+    async def get_context_for_stage_async(self, stage: str, rescan: bool = False) -> str:
+        """get_context_for_stage in a worker thread, optionally re-scanning first in the same hop"""
+        async with self._scan_lock:
+            return await asyncio.to_thread(self._scan_and_build, stage, rescan)
+    
+    def _scan_and_build(self, stage: str, rescan: bool) -> str:
+        """Worker-thread body of get_context_for_stage_async"""
+        if rescan:
+            self.scan_project_files()
+        return self.get_context_for_stage(stage)
+    
+    async def save_rag_index_async(self):
+        """save_rag_index in a worker thread; waits for a running scan so a complete index is saved"""
+        async with self._scan_lock:
+            await asyncio.to_thread(self.save_rag_index)
+    
+    def _read_contents(self, scanned, errors: List[str]) -> Dict[str, str]:
+        """Contents of the scanned files; only files whose mtime or size changed are re-read
+        
+        Files that can't be read are left out and described in `errors`.
+        """
+        contents = {}
+        to_read = []
+        for relative_path, path, st in scanned:
+            cached = self._content_cache.get(relative_path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                self._content_cache.move_to_end(relative_path)
+                contents[relative_path] = cached[2]
+            elif os.path.splitext(relative_path)[1].lower() in BINARY_EXTENSIONS:
+                contents[relative_path] = f"[Binary file: {st.st_size} bytes]"
+            elif st.st_size < 50000:  # < 50KB, limit size to avoid overload
+                to_read.append((relative_path, path, st))
+            else:
+                contents[relative_path] = f"[File too large: {st.st_size} bytes]"
+        
+        if not to_read:
+            return contents
+        
+        # read() releases the GIL, so threads keep several reads in flight.
+        # A read stuck on a slow network mount is skipped after READ_TIMEOUT
+        # instead of stalling the scan, so don't wait for the pool on exit.
+        pool = ThreadPoolExecutor(max_workers=READ_WORKERS)
+        try:
+            futures = [(relative_path, path, st,
+                        pool.submit(self._read_file, path, None if st.st_size < 10000 else PREVIEW_READ_BYTES))
+                       for relative_path, path, st in to_read]
+            for relative_path, path, st, future in futures:
+                try:
+                    content = future.result(timeout=READ_TIMEOUT)
+                except FuturesTimeoutError:
+                    errors.append(f"{path}: timed out after {READ_TIMEOUT:g}s")
+                    continue
+                except OSError as e:
+                    errors.append(f"{path}: {e}")
+                    continue
+                
+                contents[relative_path] = content
+                self._content_cache[relative_path] = (st.st_mtime_ns, st.st_size, content)
+                self._content_cache.move_to_end(relative_path)
+                if len(self._content_cache) > CONTENT_CACHE_MAX:
+                    self._content_cache.popitem(last=False)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        return contents
+    
+    @staticmethod
+    def _read_file(path: str, limit: Optional[int] = None) -> str:
+        """Read a text file (or its first `limit` bytes), falling back to latin-1 when it isn't valid UTF-8
+        
+        Reads raw bytes unbuffered and decodes once: fewer syscalls per file than
+        a text-mode open, and no second read when the UTF-8 decode fails.
+        """
+        with open(path, 'rb', buffering=0) as f:
+            data = f.read() if limit is None else f.read(limit)
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            if limit is not None and e.reason == 'unexpected end of data':
+                text = data[:e.start].decode('utf-8')  # head cut inside a character
+            else:
+                text = data.decode('latin-1')
+        # Same newline translation as text mode
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+    
+    def _walk(self, root: str, errors: List[str]):
+        """Yield (relative_path, path, is_dir) for every file and directory below root
+        
+        Depth-first with an explicit stack, in the same order as a recursive walk,
+        but each entry is yielded once instead of through one generator frame per
+        directory level. A directory that can't be listed (no permission, removed
+        mid-scan) is described in `errors` and its subtree skipped.
+        """
+        def entries_of(dirpath: str):
+            try:
+                return iter(self._list_dir(dirpath))
+            except OSError as e:
+                errors.append(f"{dirpath}: {e}")
+                return iter(())
+        
+        stack = [(root, "", entries_of(root))]
+        while stack:
+            dirpath, prefix, entries = stack[-1]
+            for name, is_dir in entries:
+                relative_path = prefix + name
+                path = os.path.join(dirpath, name)
+                yield relative_path, path, is_dir
+                if is_dir:
+                    stack.append((path, relative_path + os.sep, entries_of(path)))
+                    break
+            else:
+                stack.pop()
+    
+    def _list_dir(self, dirpath: str):
+        """Sorted (name, is_dir) entries of a directory, reused while its mtime is unchanged
+        
+        A directory's mtime only moves when entries are added, removed or renamed,
+        so an unchanged directory costs one stat instead of a scandir. File
+        contents can still change, which is why every file is still stat'ed.
+        os.scandir gets the entry types from the directory listing itself, and
+        entries are sorted by name: scandir order depends on the filesystem, and
+        a canonical order keeps every stage context (and so the prompt prefix)
+        identical between scans.
+        """
+        mtime_ns = os.stat(dirpath).st_mtime_ns
+        cached = self._dir_listings.get(dirpath)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        
+        # Half-written files from json_utils.write_atomic (e.g. a concurrent
+        # save_context) are not part of the project; the suffix is specific to it
+        with os.scandir(dirpath) as it:
+            listing = [(entry.name, entry.is_dir(follow_symlinks=False))
+                       for entry in sorted(it, key=lambda e: e.name)
+                       if entry.is_dir(follow_symlinks=False)
+                       or (entry.is_file() and not entry.name.endswith(json_utils.TMP_SUFFIX))]
+        if time.time_ns() - mtime_ns > DIR_MTIME_SLACK_NS:
+            self._dir_listings[dirpath] = (mtime_ns, listing)
+        return listing
+    
     def get_context_for_stage(self, stage: str) -> str:
         """Get the appropriate context for each stage"""
         if not self.source_index:
             self.scan_project_files()
         
-        context_builders = {
-            "requirements": self._build_requirements_context,
-            "architecture": self._build_architecture_context,
-            "code": self._build_code_context,
-            "review": self._build_review_context,
-            "deployment": self._build_deployment_context
-        }
+        builder = self._context_builders.get(stage)
+        if builder is None:
+            built_from, context = self._general_context
+            if built_from is not self.source_index:
+                context = self._build_general_context()
+                self._general_context = (self.source_index, context)
+            return context
         
-        builder = context_builders.get(stage, self._build_general_context)
-        return builder()
+        key = (stage, self._index_version)
+        context = self._context_cache.get(key)
+        if context is None:
+            context = self._context_cache[key] = builder()
+        return context
+    
+    def _stage_files(self, stage_dir: str) -> List[str]:
+        """Files under a top-level stage directory such as 03_code, in scan order"""
+        return self.source_index.get("by_stage", {}).get(stage_dir, [])
     
     def _build_requirements_context(self) -> str:
         """Context for requirements stage"""
-        req_files = [f for f in self.source_index.get("files", {}) 
-                    if "01_requirements" in f or "requirements" in f.lower()]
+        req_files = self._stage_files("01_requirements")
         
-        context = "EXISTING REQUIREMENTS FILES:\n"
+        parts = ["EXISTING REQUIREMENTS FILES:\n"]
+        contents = self.file_contents
         for file_path in req_files:
-            if file_path in self.file_contents:
-                context += f"\n{file_path}:\n{self.file_contents[file_path]}\n"
+            if file_path in contents:
+                parts.extend((f"\n{file_path}:\n", contents[file_path], "\n"))
         
-        return context
+        return "".join(parts)
     
     def _build_architecture_context(self) -> str:
         """Context for architecture stage"""
-        arch_files = [f for f in self.source_index.get("files", {}) 
-                     if "02_architecture" in f or "architecture" in f.lower()]
-        req_files = [f for f in self.source_index.get("files", {}) 
-                    if "01_requirements" in f]
+        arch_files = self._stage_files("02_architecture")
+        req_files = self._stage_files("01_requirements")
         
-        context = "EXISTING ARCHITECTURE & REQUIREMENTS:\n"
+        parts = ["EXISTING ARCHITECTURE & REQUIREMENTS:\n"]
+        contents = self.file_contents
         
         # Add requirements context
         for file_path in req_files:
-            if file_path in self.file_contents:
-                context += f"\nREQUIREMENTS - {file_path}:\n{self.file_contents[file_path]}\n"
+            if file_path in contents:
+                parts.extend((f"\nREQUIREMENTS - {file_path}:\n", contents[file_path], "\n"))
         
         # Add architecture context  
         for file_path in arch_files:
-            if file_path in self.file_contents:
-                context += f"\nARCHITECTURE - {file_path}:\n{self.file_contents[file_path]}\n"
+            if file_path in contents:
+                parts.extend((f"\nARCHITECTURE - {file_path}:\n", contents[file_path], "\n"))
         
-        return context
+        return "".join(parts)
     
     def _build_code_context(self) -> str:
         """Context for code generation stage"""
-        relevant_files = []
-        
-        # Requirements and Architecture
-        for pattern in ["01_requirements", "02_architecture"]:
-            relevant_files.extend([f for f in self.source_index.get("files", {}) if pattern in f])
-        
         # Existing code files
-        code_files = [f for f in self.source_index.get("files", {}) if "03_code" in f]
+        code_files = self._stage_files("03_code")
         
-        context = "PROJECT CONTEXT FOR CODE GENERATION:\n\n"
+        parts = ["PROJECT CONTEXT FOR CODE GENERATION:\n\n"]
+        contents = self.file_contents
         
-        # Add previous stages
-        for file_path in relevant_files:
-            if file_path in self.file_contents:
-                stage = "REQUIREMENTS" if "01_" in file_path else "ARCHITECTURE"
-                context += f"{stage} - {file_path}:\n{self.file_contents[file_path]}\n\n"
+        # Add previous stages (requirements and architecture)
+        for stage, stage_dir in (("REQUIREMENTS", "01_requirements"), ("ARCHITECTURE", "02_architecture")):
+            for file_path in self._stage_files(stage_dir):
+                if file_path in contents:
+                    parts.extend((f"{stage} - {file_path}:\n", contents[file_path], "\n\n"))
         
         # Add existing code structure
         if code_files:
-            context += "EXISTING CODE STRUCTURE:\n"
+            parts.append("EXISTING CODE STRUCTURE:\n")
+            code_set = set(code_files)
             modules = self.source_index.get("modules", {})
             for module_name, files in modules.items():
-                if any("03_code" in f for f in files):
-                    context += f"\nModule: {module_name}\n"
+                if not code_set.isdisjoint(files):
+                    parts.append(f"\nModule: {module_name}\n")
                     for file_path in files[:5]:  # Limit số files
-                        if "03_code" in file_path and file_path in self.file_contents:
-                            context += f"  {file_path}: {len(self.file_contents[file_path])} chars\n"
+                        if file_path in code_set and file_path in self.file_contents:
+                            parts.append(f"  {file_path}: {len(self.file_contents[file_path])} chars\n")
         
-        return context
+        return "".join(parts)
     
     def _build_review_context(self) -> str:
         """Context for review stage"""
-        code_files = [f for f in self.source_index.get("files", {}) if "03_code" in f]
-        
-        context = "CODE FILES FOR REVIEW:\n\n"
+        parts = ["CODE FILES FOR REVIEW:\n\n"]
         
         # Group by modules
+        code_set = set(self._stage_files("03_code"))
         modules = self.source_index.get("modules", {})
         for module_name, files in modules.items():
-            module_code_files = [f for f in files if "03_code" in f]
+            module_code_files = [f for f in files if f in code_set]
             if module_code_files:
-                context += f"MODULE: {module_name}\n"
+                parts.append(f"MODULE: {module_name}\n")
                 for file_path in module_code_files[:10]:  # Limit files
                     file_info = self.source_index["files"].get(file_path, {})
-                    context += f"  - {file_path} ({file_info.get('type', 'unknown')}, {file_info.get('size', 0)} bytes)\n"
+                    file_type = file_info.get('type', 'unknown')
+                    parts.append(f"  - {file_path} ({file_type}, {file_info.get('size', 0)} bytes)\n")
                     
                     # Add preview for important files
-                    if file_path in self.file_contents and any(ext in file_path for ext in ['.py', '.js', '.java']):
+                    if file_type in PREVIEW_TYPES and file_path in self.file_contents:
                         preview = self.file_contents[file_path][:300]
-                        context += f"    Preview: {preview}...\n"
-                context += "\n"
+                        parts.append(f"    Preview: {preview}...\n")
+                parts.append("\n")
         
-        return context
+        return "".join(parts)
     
     def _build_deployment_context(self) -> str:
         """Context for deployment stage"""
         all_stages = ["01_requirements", "02_architecture", "03_code", "04_tests"]
         
-        context = "COMPLETE PROJECT CONTEXT FOR DEPLOYMENT:\n\n"
+        parts = ["COMPLETE PROJECT CONTEXT FOR DEPLOYMENT:\n\n"]
         
         # Project summary
         summary = self.source_index.get("summary", {})
-        context += f"Project Summary:\n"
-        context += f"- Total files: {summary.get('total_files', 0)}\n"
-        context += f"- File types: {summary.get('file_types', {})}\n"
-        context += f"- Modules: {list(self.source_index.get('modules', {}).keys())}\n\n"
+        parts.append(f"Project Summary:\n")
+        parts.append(f"- Total files: {summary.get('total_files', 0)}\n")
+        parts.append(f"- File types: {summary.get('file_types', {})}\n")
+        parts.append(f"- Modules: {list(self.source_index.get('modules', {}).keys())}\n\n")
         
         # Key files from each stage
         for stage in all_stages:
-            stage_files = [f for f in self.source_index.get("files", {}) if stage in f]
+            stage_files = self._stage_files(stage)
             if stage_files:
                 stage_name = stage.split("_")[1].upper()
-                context += f"{stage_name} FILES:\n"
+                parts.append(f"{stage_name} FILES:\n")
                 for file_path in stage_files[:3]:  # Top 3 files per stage
                     if file_path in self.file_contents:
-                        context += f"  {file_path}:\n{self.file_contents[file_path][:200]}...\n\n"
+                        parts.append(f"  {file_path}:\n{self.file_contents[file_path][:200]}...\n\n")
         
-        return context
+        return "".join(parts)
     
     def _build_general_context(self) -> str:
         """General context"""
-        return f"PROJECT STRUCTURE:\n{json.dumps(self.source_index, indent=2, ensure_ascii=False)}"
+        # Structure only: the per-file entries carry content previews that would
+        # dominate the prompt on large projects
+        slim = {key: self.source_index.get(key) for key in ("summary", "directories", "modules")}
+        return f"PROJECT STRUCTURE:\n{json_utils.dumps(slim)}"
     
     def save_rag_index(self):
-        """Save the RAG index to a file"""
+        """Save the RAG index to a file, with the file previews in a JSON Lines file beside it"""
         index_file = self.project_dir / "rag_index.json"
-        with open(index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.source_index, f, indent=2, ensure_ascii=False)
+        contents_file = self.project_dir / "rag_contents.jsonl"
+        
+        files = self.source_index.get("files", {})
+        index = dict(self.source_index)
+        index["files"] = {
+            path: {key: value for key, value in info.items() if key != "content_preview"}
+            for path, info in files.items()
+        }
+        data = json_utils.dumpb(index)
+        # Each file's entry records its size and mtime, and the rest of the index is derived
+        # from the files, so unchanged entries mean unchanged previews too. The summary's
+        # last_scan and these two files' own entries change on every save, so they're left out.
+        own_files = {index_file.name, contents_file.name}
+        index_hash = hash(json_utils.dumpb({
+            "files": {path: info for path, info in index["files"].items() if path not in own_files},
+            "directories": index.get("directories", []),
+        }))
+        if index_hash == self._last_index_hash and index_file.exists():
+            logger.info(f"♻️ RAG index unchanged, skipped writing {index_file}")
+            return
+        
+        json_utils.write_atomic(index_file, data)
+        json_utils.dump_lines(
+            ({"path": path, "content_preview": info.get("content_preview", "")} for path, info in files.items()),
+            contents_file,
+        )
+        self._last_index_hash = index_hash
         
-        logger.info(f"💾 Saved RAG index to {index_file}")
\ No newline at end of file
+        logger.info(f"💾 Saved RAG index to {index_file}")
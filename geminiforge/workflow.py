@@ -1,20 +1,25 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
-import re
-from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from . import json_utils
 from .context import ProjectContext
+from .hash_utils import content_key
 from .rag_manager import RAGManager
 from .api_manager import GeminiAPIManager
 
 logger = logging.getLogger(__name__)
 
+# Characters that aren't allowed in file names on Windows (or are path separators)
+_UNSAFE_NAME_CHARS = str.maketrans(dict.fromkeys('<>:"/\\|?*', '_'))
+
+# Developer calls in flight per distinct API key during stage 3
+DEVELOPER_CALLS_PER_KEY = 4
+
 
 class ProjectWorkflowManager:
     """Manage the project’s main workflow"""
@@ -25,6 +30,14 @@ class ProjectWorkflowManager:
         self.context = ProjectContext(project_name=project_name)
         self.project_dir = Path(f"projects/{project_name}")
         self.rag_manager = RAGManager(self.project_dir)
+        # Stages 4 and 5 save concurrently; keep context writes in call order
+        self._context_lock = asyncio.Lock()
+        self._last_context_hash: Optional[int] = None
+        # Caps every stage 3 developer call (module plans and per-file generation together),
+        # so a long module list doesn't run into 429 backoffs
+        self._developer_semaphore = asyncio.Semaphore(DEVELOPER_CALLS_PER_KEY * len(api_manager.clients))
+        # (context version, status) from the last get_workflow_status
+        self._status_cache: Optional[Tuple[int, Dict[str, Any]]] = None
         self.setup_project_structure()
         
         # Load existing context if present
@@ -51,8 +64,7 @@ class ProjectWorkflowManager:
         context_file = self.project_dir / "project_context.json"
         if context_file.exists():
             try:
-                with open(context_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = json_utils.loads(context_file.read_bytes())
                 
                 # Restore context
                 self.context.requirements = data.get('requirements')
@@ -61,6 +73,7 @@ class ProjectWorkflowManager:
                 self.context.test_results = data.get('test_results')
                 self.context.deployment = data.get('deployment')
                 self.context.current_stage = data.get('current_stage', 'not_started')
+                self.context.created_at = data.get('created_at') or self.context.created_at
                 
                 logger.info(f"📂 Loaded existing context from {context_file}")
                 logger.info(f"🔄 Current stage: {self.context.current_stage}")
@@ -68,19 +81,37 @@ class ProjectWorkflowManager:
             except Exception as e:
                 logger.warning(f"⚠️ Could not load existing context: {e}")
     
-    def save_context(self):
-        """Save the current context to a file"""
+    async def save_context(self):
+        """Save the current context to a file without blocking the event loop"""
         context_file = self.project_dir / "project_context.json"
-        with open(context_file, 'w', encoding='utf-8') as f:
-            json.dump(asdict(self.context), f, indent=2, ensure_ascii=False)
+        # Snapshot now, so the file reflects the context as of this call
+        data = self.context.to_dict()
+        async with self._context_lock:
+            written = await asyncio.to_thread(self._write_context, data, context_file)
         
-        logger.info(f"💾 Saved context to {context_file}")
+        if written:
+            logger.info(f"💾 Saved context to {context_file}")
+    
+    def _write_context(self, data: Dict, context_file: Path) -> bool:
+        """Serialize and atomically write the context; returns False if it is unchanged since the last save"""
+        payload = json_utils.dumpb(data)
+        if hash(payload) == self._last_context_hash:
+            return False
+        json_utils.write_atomic(context_file, payload)
+        self._last_context_hash = hash(payload)
+        return True
+    
+    async def _rescan_and_save_index(self):
+        """Re-scan the project files and save the refreshed RAG index"""
+        await self.rag_manager.scan_project_files_async()
+        await self.rag_manager.save_rag_index_async()
     
-    def save_stage_output(self, stage: str, data: Dict, filename: str = None):
-        """Save each stage’s output to a file"""
-        if not filename:
-            filename = f"{stage}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    async def save_stage_output(self, stage: str, data: Dict, filename: str = None):
+        """Save each stage’s output to a file without blocking the event loop
         
+        Without an explicit filename the file is named after a hash of its content,
+        so re-saving an identical output (e.g. on resume) writes nothing new.
+        """
         stage_dirs = {
             "requirements": "01_requirements",
             "architecture": "02_architecture", 
@@ -89,21 +120,36 @@ class ProjectWorkflowManager:
             "deployment": "05_deployment"
         }
         
-        file_path = self.project_dir / stage_dirs[stage] / filename
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        stage_dir = self.project_dir / stage_dirs[stage]
+        file_path, written = await asyncio.to_thread(self._write_stage_output, stage, stage_dir, data, filename)
         
-        logger.info(f"💾 Saved {stage} output to {file_path}")
+        if written:
+            logger.info(f"💾 Saved {stage} output to {file_path}")
+        else:
+            logger.info(f"♻️ {stage} output unchanged, already saved as {file_path}")
         return file_path
     
+    @staticmethod
+    def _write_stage_output(stage: str, stage_dir: Path, data: Dict, filename: Optional[str]):
+        """Serialize and write a stage output; returns (path, whether it was written)"""
+        payload = json_utils.dumpb(data)
+        if filename:
+            file_path = stage_dir / filename
+        else:
+            file_path = stage_dir / f"{stage}_{content_key(payload, digest_size=8)}.json"
+            if file_path.exists():
+                return file_path, False
+        
+        json_utils.write_atomic(file_path, payload)
+        return file_path, True
+    
     async def stage_1_requirements(self, user_input: str):
         """Stage 1: Requirements analysis"""
         logger.info("🎯 Stage 1: Requirements Analysis")
         self.context.current_stage = "requirements"
         
         # Get RAG context
-        rag_context = self.rag_manager.get_context_for_stage("requirements")
+        rag_context = await self.rag_manager.get_context_for_stage_async("requirements")
         
         prompt = f"""
         Analyze this project request and create detailed requirements:
@@ -118,8 +164,7 @@ class ProjectWorkflowManager:
         self.context.requirements = result
         
         # Save file and context
-        self.save_stage_output("requirements", result)
-        self.save_context()
+        await asyncio.gather(self.save_stage_output("requirements", result), self.save_context())
         return result
     
     async def stage_2_architecture(self):
@@ -128,7 +173,7 @@ class ProjectWorkflowManager:
         self.context.current_stage = "architecture"
         
         # Get RAG context
-        rag_context = self.rag_manager.get_context_for_stage("architecture")
+        rag_context = await self.rag_manager.get_context_for_stage_async("architecture")
         
         prompt = """
         Based on the requirements, design a complete system architecture.
@@ -140,8 +185,7 @@ class ProjectWorkflowManager:
         result = await self.api_manager.call_api("architect", prompt, self.context, rag_context)
         self.context.architecture = result
         
-        self.save_stage_output("architecture", result)
-        self.save_context()
+        await asyncio.gather(self.save_stage_output("architecture", result), self.save_context())
         return result
     
     async def stage_3_code_generation(self):
@@ -149,14 +193,11 @@ class ProjectWorkflowManager:
         logger.info("💻 Stage 3: Code Generation")
         self.context.current_stage = "code"
         
-        # Scan existing files first
-        self.rag_manager.scan_project_files()
-        
         # Fetch the list of modules from the architecture
         modules = self.context.architecture.get('modules', ['backend', 'frontend', 'database'])
         
-        # Get RAG context
-        rag_context = self.rag_manager.get_context_for_stage("code")
+        # Scan existing files first, then get the RAG context
+        rag_context = await self.rag_manager.get_context_for_stage_async("code", rescan=True)
         
         # Run prompts for each module in parallel
         tasks = []
@@ -192,6 +233,8 @@ class ProjectWorkflowManager:
             "status": "completed"
         }
         
+        # Dependencies in first-seen order, deduplicated as they are merged
+        dependencies = {}
         for i, module in enumerate(modules):
             if isinstance(results[i], Exception):
                 logger.error(f"❌ Module {module} generation failed: {results[i]}")
@@ -201,61 +244,97 @@ class ProjectWorkflowManager:
                 combined_result["modules"][module] = results[i]
                 
                 # Merge dependencies
-                module_deps = results[i].get("dependencies", [])
-                combined_result["dependencies"].extend(module_deps)
+                dependencies.update(dict.fromkeys(results[i].get("dependencies", [])))
         
-        # Remove duplicate dependencies
-        combined_result["dependencies"] = list(set(combined_result["dependencies"]))
+        combined_result["dependencies"] = list(dependencies)
         
-        self.context.codebase = combined_result
-        self.save_stage_output("code", combined_result)
+        # Write out the planned files, one developer call per file
+        await self.generate_module_files(combined_result, rag_context)
         
-        # Create the actual code files
-        await self.create_code_files(combined_result)
+        self.context.codebase = combined_result
+        # Save the output and create the actual code files
+        await asyncio.gather(self.save_stage_output("code", combined_result), self.create_code_files(combined_result))
         
         # Update RAG index after creating files
-        self.rag_manager.scan_project_files()
-        self.rag_manager.save_rag_index()
-        
-        self.save_context()
+        await self.rag_manager.scan_project_files_async()
+        await asyncio.gather(self.rag_manager.save_rag_index_async(), self.save_context())
         return combined_result
     
     async def generate_module_code(self, module_name: str, prompt: str, rag_context: str):
         """Generate code for a specific module"""
-        logger.info(f"⚙️ Generating code for {module_name}")
+        async with self._developer_semaphore:
+            logger.info(f"⚙️ Generating code for {module_name}")
+            return await self.api_manager.call_api("developer", prompt, self.context, rag_context)
+    
+    async def generate_module_files(self, combined_result: Dict, rag_context: str):
+        """Generate the full content of each module's planned files concurrently
         
-        result = await self.api_manager.call_api("developer", prompt, self.context, rag_context)
-        return result
+        The module call only returns the file plan with short drafts; per-file
+        calls keep each response small enough to avoid output truncation. A
+        draft is kept whenever its per-file call fails.
+        """
+        module_names = []
+        jobs = []
+        for module_name, module_data in combined_result["modules"].items():
+            code_files = module_data.get("code_files")
+            if not isinstance(code_files, dict) or not code_files or module_data.get("status") == "partial_failure":
+                continue
+            
+            file_prompts = {}
+            for file_path, draft in code_files.items():
+                file_prompts[file_path] = f"""
+            Write the complete contents of `{file_path}` for the {module_name} module.
+            
+            Other files in this module: {", ".join(p for p in code_files if p != file_path)}
+            Draft or description from the module plan: {str(draft)[:500]}
+            
+            Return ONLY valid JSON with this structure:
+            {{"path": "{file_path}", "content": "COMPLETE_FILE_CONTENT_HERE"}}
+            """
+            
+            logger.info(f"⚙️ Generating {len(file_prompts)} files for {module_name}")
+            module_names.append(module_name)
+            jobs.append(self.api_manager.generate_files("developer", file_prompts, self.context, rag_context,
+                                                        semaphore=self._developer_semaphore))
+        
+        results = await asyncio.gather(*jobs)
+        
+        for module_name, generated in zip(module_names, results):
+            module_data = combined_result["modules"][module_name]
+            # Build new dicts, the module result may be shared with the response cache
+            combined_result["modules"][module_name] = {
+                **module_data,
+                "code_files": {**module_data["code_files"], **generated},
+            }
     
     async def create_code_files(self, codebase_data: Dict):
         """Create real code files from JSON data"""
         code_dir = self.project_dir / "03_code"
         
+        files = {}
+        module_dirs = []  # every module gets its directory, even without files
         for module_name, module_data in codebase_data.get("modules", {}).items():
             module_dir = code_dir / module_name
-            module_dir.mkdir(exist_ok=True)
+            module_dirs.append(module_dir)
             
             # Create files from code_files
             if "code_files" in module_data:
                 for file_path, file_content in module_data["code_files"].items():
-                    full_path = module_dir / file_path
-                    full_path.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    with open(full_path, 'w', encoding='utf-8') as f:
-                        f.write(file_content)
-                    
-                    logger.info(f"📄 Created {full_path}")
+                    files[module_dir / file_path] = file_content
+        
+        errors = await self._write_files(files, module_dirs)
+        for full_path, error in errors.items():
+            if error is None:
+                logger.info(f"📄 Created {full_path}")
+        self._raise_first(errors)
     
     async def stage_4_review_and_test(self):
         """Stage 4: Code review and test generation"""
         logger.info("🧪 Stage 4: Code Review & Testing")
         self.context.current_stage = "review"
         
-        # Scan existing files first
-        self.rag_manager.scan_project_files()
-        
-        # Get RAG context
-        rag_context = self.rag_manager.get_context_for_stage("review")
+        # Scan existing files first, then get the RAG context
+        rag_context = await self.rag_manager.get_context_for_stage_async("review", rescan=True)
         
         prompt = """
         Review the generated codebase and create COMPLETE test files:
@@ -273,38 +352,31 @@ class ProjectWorkflowManager:
         result = await self.api_manager.call_api("reviewer", prompt, self.context, rag_context)
         self.context.test_results = result
         
-        self.save_stage_output("review", result)
-        
+        saves = [self.save_stage_output("review", result), self.save_context()]
         # Generate test files if present
         if "test_files" in result:
-            await self.create_test_files(result["test_files"])
-        
-        self.save_context()
+            saves.append(self.create_test_files(result["test_files"]))
+        await asyncio.gather(*saves)
         return result
     
     async def create_test_files(self, test_data: Dict):
         """Create test files"""
         test_dir = self.project_dir / "04_tests"
         
-        for file_path, file_content in test_data.items():
-            full_path = test_dir / file_path
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(file_content)
-            
-            logger.info(f"🧪 Created test file {full_path}")
+        errors = await self._write_files({test_dir / file_path: file_content
+                                          for file_path, file_content in test_data.items()})
+        for full_path, error in errors.items():
+            if error is None:
+                logger.info(f"🧪 Created test file {full_path}")
+        self._raise_first(errors)
     
     async def stage_5_deployment(self):
         """Stage 5: Create deployment configurations"""
         logger.info("🔄 Stage 5: Deployment & DevOps")
         self.context.current_stage = "deployment"
         
-        # Scan existing files first
-        self.rag_manager.scan_project_files()
-        
-        # Get RAG context
-        rag_context = self.rag_manager.get_context_for_stage("deployment")
+        # Scan existing files first, then get the RAG context
+        rag_context = await self.rag_manager.get_context_for_stage_async("deployment", rescan=True)
         
         prompt = """
         Create COMPLETE deployment configuration files:
@@ -323,12 +395,12 @@ class ProjectWorkflowManager:
         result = await self.api_manager.call_api("devops", prompt, self.context, rag_context)
         self.context.deployment = result
         
-        self.save_stage_output("deployment", result)
-        
-        # Create deployment files with safe path handling
-        await self.create_deployment_files_safe(result)
-        
-        self.save_context()
+        await asyncio.gather(
+            self.save_stage_output("deployment", result),
+            # Create deployment files with safe path handling
+            self.create_deployment_files_safe(result),
+            self.save_context(),
+        )
         return result
     
     async def create_deployment_files_safe(self, deployment_data: Dict):
@@ -341,41 +413,111 @@ class ProjectWorkflowManager:
             "k8s_manifests": "kubernetes"
         }
         
+        files = {}
+        folders = []
+        sources = {}  # written path -> (folder, original file name, original content)
         for data_key, folder_name in file_mappings.items():
             if data_key in deployment_data:
                 folder_path = deploy_dir / folder_name
-                folder_path.mkdir(parents=True, exist_ok=True)  # Ensure parents exist
+                folders.append(folder_path)
                 
                 files_data = deployment_data[data_key]
                 if isinstance(files_data, dict):
                     for file_name, file_content in files_data.items():
-                        # Safe file path handling
-                        try:
-                            # Clean file name and create safe path
-                            safe_file_name = re.sub(r'[<>:"/\\|?*]', '_', file_name)
-                            file_path = folder_path / safe_file_name
-                            
-                            # Ensure parent directory exists
-                            file_path.parent.mkdir(parents=True, exist_ok=True)
-                            
-                            # Write file content
-                            content = file_content if isinstance(file_content, str) else str(file_content)
-                            
-                            with open(file_path, 'w', encoding='utf-8') as f:
-                                f.write(content)
-                            
-                            logger.info(f"🚀 Created deployment file {file_path}")
-                            
-                        except Exception as e:
-                            logger.error(f"❌ Failed to create deployment file {file_name}: {e}")
-                            # Create a simple text file with the error
-                            error_file = folder_path / f"error_{safe_file_name}.txt"
-                            with open(error_file, 'w', encoding='utf-8') as f:
-                                f.write(f"Error creating {file_name}: {e}\n\nOriginal content:\n{file_content}")
-                            logger.info(f"📝 Created error file {error_file}")
+                        # Clean file name and create safe path
+                        file_path = folder_path / file_name.translate(_UNSAFE_NAME_CHARS)
+                        files[file_path] = file_content if isinstance(file_content, str) else str(file_content)
+                        sources[file_path] = (folder_path, file_name, file_content)
+        
+        error_files = {}
+        for file_path, error in (await self._write_files(files, folders)).items():
+            if error is None:
+                logger.info(f"🚀 Created deployment file {file_path}")
+                continue
+            folder_path, file_name, file_content = sources[file_path]
+            logger.error(f"❌ Failed to create deployment file {file_name}: {error}")
+            # Create a simple text file with the error
+            error_files[folder_path / f"error_{file_path.name}.txt"] = \
+                f"Error creating {file_name}: {error}\n\nOriginal content:\n{file_content}"
+        
+        if error_files:
+            errors = await self._write_files(error_files)
+            for error_file, error in errors.items():
+                if error is None:
+                    logger.info(f"📝 Created error file {error_file}")
+            self._raise_first(errors)
+    
+    @staticmethod
+    async def _write_files(files: Dict[Path, str], dirs: Iterable[Path] = ()) -> Dict[Path, Optional[BaseException]]:
+        """Write text files concurrently from worker threads
+        
+        `dirs` are extra directories to create even if no file lands in them.
+        Every directory is created once, up front, so the writes don't race on
+        mkdir. Entries whose content isn't text are logged and skipped. Returns
+        each written file's exception, or None if it was written.
+        """
+        written = []
+        for path, content in files.items():
+            if isinstance(content, str):
+                written.append(path)
+            else:
+                logger.warning(f"⚠️ Skipped {path}: content is {type(content).__name__}, not text")
+        
+        all_dirs = set(dirs)
+        all_dirs.update(path.parent for path in written)
+        await asyncio.to_thread(ProjectWorkflowManager._make_dirs, all_dirs)
+        
+        results = await asyncio.gather(
+            *(asyncio.to_thread(path.write_text, files[path], encoding='utf-8') for path in written),
+            return_exceptions=True,
+        )
+        return {path: result if isinstance(result, BaseException) else None
+                for path, result in zip(written, results)}
+    
+    @staticmethod
+    def _make_dirs(dirs):
+        """Create each directory (and its parents) if it doesn't exist yet"""
+        for directory in sorted(dirs):
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def _raise_first(errors: Dict[Path, Optional[BaseException]]):
+        """Re-raise the first failed write, as the one-file-at-a-time loops did"""
+        for error in errors.values():
+            if error is not None:
+                raise error
+    
+    async def run_review_and_deployment(self):
+        """Stages 4 & 5: run review and deployment concurrently
+        
+        Both stages only depend on the generated codebase, so their Gemini
+        calls can overlap. call_api already falls back to the default
+        structure per agent; an exception here leaves only the failed stage
+        unset so resume_workflow picks it up again.
+        """
+        stages = {}
+        if not self.context.test_results:
+            stages["review"] = self.stage_4_review_and_test()
+        if not self.context.deployment:
+            stages["deployment"] = self.stage_5_deployment()
+        
+        results = await asyncio.gather(*stages.values(), return_exceptions=True)
+        
+        errors = []
+        for stage, result in zip(stages, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Stage {stage} failed: {result}")
+                errors.append(result)
+        
+        if errors:
+            raise errors[0]
+        return dict(zip(stages, results))
     
     def get_workflow_status(self) -> Dict[str, Any]:
-        """Get the current workflow status"""
+        """Get the current workflow status, rebuilt only after the context changes"""
+        if self._status_cache is not None and self._status_cache[0] == self.context.version:
+            return self._status_cache[1]
+        
         stages = {
             "requirements": self.context.requirements is not None,
             "architecture": self.context.architecture is not None,
@@ -387,7 +529,7 @@ class ProjectWorkflowManager:
         completed_stages = sum(stages.values())
         total_stages = len(stages)
         
-        return {
+        status = {
             "current_stage": self.context.current_stage,
             "stages": stages,
             "progress": f"{completed_stages}/{total_stages}",
@@ -395,6 +537,8 @@ class ProjectWorkflowManager:
             "project_dir": str(self.project_dir),
             "last_updated": datetime.now().isoformat()
         }
+        self._status_cache = (self.context.version, status)
+        return status
     
     async def resume_workflow(self, user_input: str = None):
         """Resume the workflow from the current stage"""
@@ -414,15 +558,12 @@ class ProjectWorkflowManager:
         if not self.context.codebase:
             await self.stage_3_code_generation()
         
-        if not self.context.test_results:
-            await self.stage_4_review_and_test()
-        
-        if not self.context.deployment:
-            await self.stage_5_deployment()
+        if not self.context.test_results or not self.context.deployment:
+            await self.run_review_and_deployment()
         
         # Mark as completed
         self.context.current_stage = "completed"
-        self.save_context()
+        await self.save_context()
         
         logger.info("✅ Workflow completed successfully!")
         return self.context
@@ -446,19 +587,14 @@ class ProjectWorkflowManager:
             # Stage 3: Code Generation
             await self.stage_3_code_generation()
             
-            # Stage 4: Review & Test
-            await self.stage_4_review_and_test()
-            
-            # Stage 5: Deployment
-            await self.stage_5_deployment()
+            # Stage 4 & 5: Review & Test + Deployment (independent, run concurrently)
+            await self.run_review_and_deployment()
             
             # Mark as completed
             self.context.current_stage = "completed"
-            self.save_context()
             
-            # Final RAG index save
-            self.rag_manager.scan_project_files()
-            self.rag_manager.save_rag_index()
+            # Final context and RAG index save
+            await asyncio.gather(self.save_context(), self._rescan_and_save_index())
             
             logger.info(f"✅ Workflow completed successfully!")
             logger.info(f"📁 Project files saved in: {self.project_dir}")
@@ -468,5 +604,5 @@ class ProjectWorkflowManager:
         except Exception as e:
             logger.error(f"❌ Workflow failed: {e}")
             # Save current progress
-            self.save_context()
+            await self.save_context()
             raise
\ No newline at end of file